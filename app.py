@@ -2,12 +2,13 @@ import streamlit as st
 import yfinance as yf
 import pandas as pd
 import numpy as np
-import cufflinks as cf
-from datetime import date
+import io
+import plotly.graph_objects as go
+import plotly.express as px
+from plotly.subplots import make_subplots
+from datetime import datetime, timezone
 from dateutil.relativedelta import relativedelta
 
-cf.go_offline()
-
 # ---------------- PAGE CONFIG ----------------
 st.set_page_config(
     page_title="📈 DataForge | Stock Analytics",
@@ -20,169 +21,338 @@ st.caption("Built by Jaswanth Rathore (JR)")
 # ---------------- SIDEBAR ----------------
 st.sidebar.header("⚙️ Controls")
 
+TICKERS = ['NVDA', 'INTC', 'AMD', 'TSM', 'MU']
+# Portfolio allocation per ticker, as the app has always shown it
+WEIGHTS = {'NVDA': 0.25, 'INTC': 0.2, 'AMD': 0.1, 'TSM': 0.2, 'MU': 0.25}
+MAX_MONTHS = 24
+
+# Keep the selection in the URL so reruns and shared links land on the same view.
+# The URL only seeds each keyed widget once; after that the widget owns its state.
+params = st.query_params
+
+if "ticker" not in st.session_state:
+    default_ticker = params.get("ticker", TICKERS[0])
+    st.session_state.ticker = default_ticker if default_ticker in TICKERS else TICKERS[0]
+
+if "months" not in st.session_state:
+    try:
+        st.session_state.months = min(max(int(params.get("months", 6)), 1), MAX_MONTHS)
+    except ValueError:
+        st.session_state.months = 6
+
+VIEWS = ["Prices", "Returns", "Portfolio", "Correlation"]
+if "view" not in st.session_state:
+    default_view = params.get("view", VIEWS[0])
+    st.session_state.view = default_view if default_view in VIEWS else VIEWS[0]
+
 ticker = st.sidebar.selectbox(
     "Select Stock",
-    ['NVDA', 'INTC', 'AMD', 'TSM', 'MU']
+    TICKERS,
+    key="ticker"
 )
 
 months = st.sidebar.slider(
     "Historical Period (Months)",
-    1, 24, 6
+    1, MAX_MONTHS,
+    key="months"
+)
+
+# Only the selected view's figures are built and sent to the browser
+view = st.sidebar.radio(
+    "View",
+    VIEWS,
+    key="view"
 )
 
+st.query_params.update(ticker=ticker, months=str(months), view=view)
+
 # ---------------- DATA LOADERS ----------------
-@st.cache_data(show_spinner=True)
-def load_stock(ticker, months):
-    df = yf.download(
-        ticker,
-        start=date.today() - relativedelta(months=months),
-        end=date.today(),
-        group_by="column",
-        auto_adjust=False
+# Raw download, held in memory for a few minutes so a symbol Yahoo is failing on
+# is retried shortly without every rerun from every session hitting Yahoo again
+@st.cache_data(ttl=600, show_spinner=False)
+def download_max(end):
+    # One batched request for every ticker over the longest slider window;
+    # the selected stock and shorter windows are sliced out in memory
+    return yf.download(
+        TICKERS,
+        start=end - relativedelta(months=MAX_MONTHS),
+        end=end,
+        group_by="ticker",
+        auto_adjust=False,
+        threads=True,
+        progress=False
     )
 
-    # Flatten columns if MultiIndex
-    if isinstance(df.columns, pd.MultiIndex):
-        df.columns = df.columns.get_level_values(0)
 
-    return df
+def price_panel(df):
+    # ✅ SAFE price column selection; a ticker yfinance could not fetch comes back
+    # as all-NaN columns (or not at all), so reindex to keep every ticker present
+    if df.empty:
+        return pd.DataFrame(np.nan, index=df.index, columns=TICKERS, dtype=np.float32)
 
+    price_col = "Adj Close" if "Adj Close" in df.columns.get_level_values(1) else "Close"
+    return df.xs(price_col, level=1, axis=1).reindex(columns=TICKERS).astype(np.float32)
 
-@st.cache_data(show_spinner=True)
-def load_sector(tickers, months):
-    df = yf.download(
-        tickers,
-        start=date.today() - relativedelta(months=months),
-        end=date.today(),
-        group_by="column",
-        auto_adjust=False
-    )
 
-    if isinstance(df.columns, pd.MultiIndex):
-        df.columns = df.columns.get_level_values(0)
+def missing_tickers(panel):
+    return panel.columns[panel.isna().all()].tolist()
+
 
+# Only complete downloads are persisted, keyed on the UTC day so disk entries
+# stay valid until the next trading day
+@st.cache_data(persist="disk", show_spinner=False)
+def load_complete(end):
+    df = download_max(end)
+    missing = missing_tickers(price_panel(df))
+    if missing:
+        raise ValueError(f"yfinance returned no data for {', '.join(missing)}")
     return df
 
 
-# ---------------- MAIN STOCK ----------------
+def load_max(end):
+    # Streamlit does not cache exceptions, so a partial download never reaches
+    # the disk cache; it is served from the short-lived in-memory one instead
+    try:
+        return load_complete(end)
+    except ValueError:
+        return download_max(end)
+
+
+def load_window(start, end):
+    df = load_max(end)
+    return df if df.empty else df.loc[pd.Timestamp(start):]
+
+
+@st.cache_data(show_spinner=False)
+def stock_csv(ticker, start, end):
+    # Serialised once per (ticker, window) instead of on every widget interaction
+    buf = io.BytesIO()
+    load_window(start, end).xs(ticker, level=0, axis=1).dropna(how="all").to_csv(buf)
+    return buf.getvalue()
+
+
+today = datetime.now(timezone.utc).date()
+start = today - relativedelta(months=months)
 try:
-    stock_data = load_stock(ticker, months)
+    all_data = load_window(start, today)
+except Exception as e:
+    st.error(f"⚠️ Unable to load stock data. Please try again. ({e})")
+    st.stop()
 
-    # ✅ SAFE price column selection
-    price_col = "Adj Close" if "Adj Close" in stock_data.columns else "Close"
+if all_data.empty:
+    st.error("⚠️ Unable to load stock data. Please try again.")
+    st.stop()
 
-    st.subheader(f"📌 {ticker} Overview")
-    st.dataframe(stock_data, use_container_width=True)
+# float32 halves the working set and the chart payloads with no visible difference
+sector_prices = price_panel(all_data)
+# Views that need a missing ticker show an error; the rest still render
+missing = missing_tickers(sector_prices)
 
-    prices = stock_data[price_col]
-    returns = prices.pct_change().dropna()
+# ---------------- RETURNS ----------------
+# Log-returns for every ticker, computed once per price window and shared across reruns
+@st.cache_data(show_spinner=False, max_entries=32)
+def log_returns(sector_prices):
+    return np.diff(np.log(sector_prices.to_numpy()), axis=0)
+
+
+logret = log_returns(sector_prices)
 
-    # ---------------- KPIs ----------------
-    col1, col2, col3 = st.columns(3)
-    col1.metric("Latest Price ($)", f"{prices.iloc[-1]:.2f}")
-    col2.metric(
-        "Total Return (%)",
-        f"{((prices.iloc[-1] / prices.iloc[0]) - 1) * 100:.2f}"
-    )
-    col3.metric(
-        "Annual Volatility",
-        f"{returns.std() * np.sqrt(252):.2f}"
-    )
 
-    # ---------------- PRICE GRAPHS ----------------
+# ---------------- CHARTS ----------------
+# Line/area toggle only reruns this chart, not the whole script
+@st.fragment
+def price_trend(prices, ticker):
+    style = st.radio("Chart Style", ["Line", "Area"], horizontal=True, key="price_style")
     st.plotly_chart(
-        prices.iplot(
-            asFigure=True,
-            title=f"{ticker} Price Trend",
-            colors=["green"]
+        go.Figure(
+            go.Scatter(
+                x=prices.index, y=prices.values, mode="lines",
+                fill="tozeroy" if style == "Area" else None, line_color="green"
+            ),
+            layout_title_text=f"{ticker} Price Trend"
         ),
         use_container_width=True
     )
 
-    st.plotly_chart(
-        prices.iplot(
-            asFigure=True,
-            fill=True,
-            title="Price Area Representation",
-            colors=["green"]
+
+# Heaviest chart on the page, so the built figure is kept per (ticker, window)
+@st.cache_resource(show_spinner=False, max_entries=32)
+def technical_figure(ticker, start, end):
+    # Candles with SMA(10/20) and Bollinger(20, 2σ) overlays, volume underneath
+    stock_data = load_window(start, end).xs(ticker, level=0, axis=1).dropna(how="all")
+    ohlc = stock_data[["Open", "High", "Low", "Close"]].astype(np.float32)
+    close = ohlc["Close"]
+    sma10 = close.rolling(10).mean()
+    window20 = close.rolling(20)
+    sma20 = window20.mean()
+    std20 = window20.std()
+
+    fig = make_subplots(
+        rows=2, cols=1, shared_xaxes=True,
+        row_heights=[0.75, 0.25], vertical_spacing=0.03
+    )
+    fig.add_trace(
+        go.Candlestick(
+            x=stock_data.index,
+            open=ohlc["Open"],
+            high=ohlc["High"],
+            low=ohlc["Low"],
+            close=close,
+            name=ticker
         ),
-        use_container_width=True
+        row=1, col=1
     )
-
-    # ---------------- RETURNS HISTOGRAM ----------------
-    st.plotly_chart(
-        returns.iplot(
-            asFigure=True,
-            kind="hist",
-            title="Daily Returns Distribution"
+    fig.add_trace(go.Scatter(x=close.index, y=sma10, name="SMA(10)"), row=1, col=1)
+    fig.add_trace(go.Scatter(x=close.index, y=sma20, name="SMA(20)"), row=1, col=1)
+    fig.add_trace(
+        go.Scatter(
+            x=close.index, y=sma20 + 2 * std20, name="Upper Band",
+            line=dict(width=1, dash="dash", color="grey")
         ),
-        use_container_width=True
+        row=1, col=1
     )
-
-    # ---------------- TECHNICAL ANALYSIS ----------------
-    qf = cf.QuantFig(
-        stock_data,
+    fig.add_trace(
+        go.Scatter(
+            x=close.index, y=sma20 - 2 * std20, name="Lower Band",
+            line=dict(width=1, dash="dash", color="grey"), fill="tonexty"
+        ),
+        row=1, col=1
+    )
+    fig.add_trace(
+        go.Bar(x=stock_data.index, y=stock_data["Volume"], name="Volume"),
+        row=2, col=1
+    )
+    fig.update_layout(
         title="Technical Indicators",
-        legend="top",
-        name=ticker
+        legend=dict(orientation="h", yanchor="bottom", y=1.02),
+        xaxis_rangeslider_visible=False
+    )
+    return fig
+
+
+# Keyed on the log-return bytes, so reruns on the same window skip the rebuild
+@st.cache_resource(show_spinner=False, max_entries=32)
+def correlation_figure(logret):
+    # float32 end to end halves the bytes walked; dtype= keeps np.cov from upcasting.
+    # Rows with a missing quote are dropped up front; np.corrcoef does not skip NaNs
+    arr = logret.astype(np.float32, copy=False)
+    arr = arr[~np.isnan(arr).any(axis=1)]
+    corr = pd.DataFrame(
+        np.corrcoef(arr, rowvar=False, dtype=np.float32),
+        index=TICKERS, columns=TICKERS
+    )
+    return px.imshow(
+        corr,
+        title="Correlation Heatmap",
+        color_continuous_scale="RdBu"
     )
-    qf.add_sma([10, 20])
-    qf.add_bollinger_bands()
-    qf.add_volume()
 
-    st.plotly_chart(qf.iplot(asFigure=True), use_container_width=True)
 
-except Exception as e:
-    st.error("⚠️ Unable to load stock data. Please try again.")
+# Depends only on the sector window, so ticker changes reuse the built figures
+@st.cache_resource(show_spinner=False, max_entries=32)
+def portfolio_figures(sector_prices):
+    # Simple returns for the weighted sum; the first day contributes no return.
+    # Forward-fill like pct_change() did, so the move across a missing quote is kept
+    a = sector_prices.ffill().to_numpy()
+    returns = np.empty_like(a)
+    returns[0] = 0
+    np.divide(a[1:], a[:-1], out=returns[1:])
+    returns[1:] -= 1
+    np.nan_to_num(returns, copy=False)
+
+    weights = np.array([WEIGHTS[t] for t in sector_prices.columns], dtype=np.float32)
+    portfolio_returns = pd.Series(returns @ weights, index=sector_prices.index)
+    cumulative_returns = (portfolio_returns + 1).cumprod()
+
+    cumulative_fig = go.Figure(
+        go.Scatter(x=cumulative_returns.index, y=cumulative_returns.values, mode="lines"),
+        layout_title_text="Cumulative Portfolio Returns"
+    )
 
-# ---------------- PORTFOLIO ANALYSIS ----------------
-st.divider()
-st.subheader("📊 Semiconductor Portfolio Visualization")
+    allocation = pd.DataFrame({
+        "Stock": sector_prices.columns,
+        "Weight": weights
+    })
+    allocation_fig = px.pie(allocation, names="Stock", values="Weight", title="Portfolio Allocation")
 
-sector_data = load_sector(['NVDA', 'INTC', 'AMD', 'TSM', 'MU'], months)
+    return cumulative_fig, allocation_fig
 
-price_col = "Adj Close" if "Adj Close" in sector_data.columns else "Close"
-prices = sector_data[price_col]
 
-returns = prices.pct_change().fillna(0)
+# ---------------- MAIN STOCK ----------------
+# The selected stock's overview, KPIs and charts need only that ticker's data
+stock_ok = ticker not in missing
 
-weights = np.array([0.1, 0.2, 0.25, 0.25, 0.2])
-portfolio_returns = (returns * weights).sum(axis=1)
-cumulative_returns = (portfolio_returns + 1).cumprod()
+if not stock_ok:
+    st.error(f"⚠️ Unable to load {ticker} data right now. Please try again shortly.")
+else:
+    stock_data = all_data.xs(ticker, level=0, axis=1).dropna(how="all")
+    prices = sector_prices[ticker].dropna()
 
-# ---------------- PORTFOLIO GRAPHS ----------------
-st.plotly_chart(
-    cumulative_returns.iplot(
-        asFigure=True,
-        title="Cumulative Portfolio Returns"
-    ),
-    use_container_width=True
-)
+    st.subheader(f"📌 {ticker} Overview")
+    st.dataframe(stock_data, use_container_width=True)
+    st.download_button(
+        "⬇️ Download CSV",
+        data=stock_csv(ticker, start, today),
+        file_name=f"{ticker}_{start}_{today}.csv",
+        mime="text/csv"
+    )
 
-allocation = pd.DataFrame({
-    "Stock": prices.columns,
-    "Weight": weights
-})
-
-st.plotly_chart(
-    allocation.iplot(
-        kind="pie",
-        labels="Stock",
-        values="Weight",
-        title="Portfolio Allocation"
-    ),
-    use_container_width=True
-)
+    stock_logret = logret[:, TICKERS.index(ticker)]
+    stock_logret = stock_logret[~np.isnan(stock_logret)]
+    returns = np.expm1(stock_logret)
 
-st.plotly_chart(
-    returns.corr().iplot(
-        asFigure=True,
-        kind="heatmap",
-        title="Correlation Heatmap",
-        colorscale="RdBu"
-    ),
-    use_container_width=True
-)
+    p = prices.to_numpy()
+    latest, first = float(p[-1]), float(p[0])
+
+    # ---------------- KPIs ----------------
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Latest Price ($)", f"{latest:.2f}")
+    col2.metric(
+        "Total Return (%)",
+        f"{(latest / first - 1) * 100:.2f}"
+    )
+    col3.metric(
+        "Annual Volatility",
+        f"{stock_logret.std(ddof=1) * np.sqrt(252):.2f}"
+    )
+
+# ---------------- PRICE GRAPHS ----------------
+if view == "Prices":
+    if stock_ok:
+        price_trend(prices, ticker)
+
+        # ---------------- TECHNICAL ANALYSIS ----------------
+        st.plotly_chart(technical_figure(ticker, start, today), use_container_width=True)
+
+# ---------------- RETURNS HISTOGRAM ----------------
+elif view == "Returns":
+    if stock_ok:
+        st.plotly_chart(
+            px.histogram(x=returns, title="Daily Returns Distribution"),
+            use_container_width=True
+        )
+
+# ---------------- PORTFOLIO ANALYSIS ----------------
+elif view == "Portfolio":
+    st.divider()
+    st.subheader("📊 Semiconductor Portfolio Visualization")
+
+    if missing:
+        st.error(f"⚠️ The portfolio needs every ticker; no data for {', '.join(missing)} right now.")
+    else:
+        cumulative_fig, allocation_fig = portfolio_figures(sector_prices)
+        st.plotly_chart(cumulative_fig, use_container_width=True)
+        st.plotly_chart(allocation_fig, use_container_width=True)
+
+# ---------------- CORRELATION ----------------
+elif view == "Correlation":
+    st.divider()
+    st.subheader("📊 Semiconductor Return Correlation")
+
+    if missing:
+        st.error(f"⚠️ The correlation needs every ticker; no data for {', '.join(missing)} right now.")
+    else:
+        st.plotly_chart(correlation_figure(logret), use_container_width=True)
 
 # ---------------- FOOTER ----------------
 st.divider()